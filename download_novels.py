@@ -7,6 +7,7 @@
   - https://github.com/POf-L/Fanqie-novel-Downloader (Python版)
 """
 
+import argparse
 import json
 import os
 import re
@@ -14,6 +15,13 @@ import sys
 import time
 import random
 import html
+import hashlib
+import shutil
+import threading
+from queue import Queue, Empty
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from pathlib import Path
 
 import requests
@@ -26,6 +34,8 @@ urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 WORK_DIR = Path(__file__).parent.resolve()
 CONFIG_FILE = WORK_DIR / "novels.json"
 OUTPUT_DIR = WORK_DIR / "output"
+# 每次运行的增量文件（仅包含本次新增章节），不参与缓存
+DELTA_DIR = WORK_DIR / "delta"
 STATE_FILE = WORK_DIR / "state.json"
 
 # 番茄小说 Web 端
@@ -40,6 +50,33 @@ THIRD_PARTY_NODES = [
     "https://fq.shusan.cn",
 ]
 
+# 对冲请求（可选）: 主请求超过延迟分位数仍未返回时，向下一个节点/端点补发一次，先到先用
+HEDGE_PERCENTILE = 0.9       # 触发对冲的延迟分位数
+HEDGE_MAX_RATIO = 0.1        # 对冲请求占逐章请求的最大比例
+HEDGE_MIN_SAMPLES = 20       # 样本不足时使用默认延迟
+HEDGE_DEFAULT_DELAY = 3.0    # 默认对冲延迟（秒）
+HEDGE_POOL_SIZE = 8          # 对冲线程池大小，落败请求无法取消，需为其留足线程
+
+# 运行预算: 默认给 GitHub Actions 单个 job 的 6 小时上限预留余量，到点后保存进度并退出
+RUN_TIME_BUDGET = 5.5 * 3600
+MIN_REQUEST_TIMEOUT = 2      # 剩余时间不足该值（秒）时视为预算耗尽，不再发起请求
+
+# 网页抓取兜底: 会话池大小，每个会话独立 Cookie/UA，并各自保持请求间隔
+WEB_POOL_SIZE = 4
+WEB_PACE = (0.3, 0.8)        # 单个会话两次请求之间的间隔（秒）
+WEB_BURST_SIZE = 10          # 单个会话每请求这么多章后额外暂停
+WEB_BURST_PAUSE = (0.5, 1.0) # 额外暂停时长（秒）
+
+# 输出文件中失败章节的占位文本
+FAILED_PLACEHOLDER = "[内容获取失败]"
+
+# 守护模式: 常驻进程，复用连接与节点状态，按各书的间隔轮询
+DAEMON_POLL_INTERVAL = 1800      # 默认每本书的轮询间隔（秒）
+DAEMON_REPROBE_INTERVAL = 600    # 无可用节点时的重新探测间隔（秒）
+DAEMON_STATUS_HOST = "127.0.0.1"
+DAEMON_STATUS_PORT = 8765
+DAEMON_DELTA_RETENTION = 7 * 24 * 3600   # 守护模式下增量文件的保留时长（秒）
+
 # ===================== 请求会话 =====================
 
 session = requests.Session()
@@ -77,23 +114,95 @@ def sanitize_filename(filename):
     return result if result else "unknown"
 
 
+def sha256_text(text):
+    """计算文本（UTF-8 编码）的 SHA-256 校验和"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
 def rotate_ua():
     """随机切换 User-Agent"""
     session.headers["User-Agent"] = random.choice(USER_AGENTS)
 
 
+# ===================== 运行预算 =====================
+
+
+class BudgetExhausted(Exception):
+    """时间或请求预算已耗尽"""
+
+
+class Budget:
+    """
+    时间/请求预算
+    可嵌套: 单本小说的预算同时受整次运行预算约束
+    """
+
+    def __init__(self, seconds=None, requests=None, parent=None):
+        self.deadline = time.monotonic() + seconds if seconds else None
+        self.max_requests = requests
+        self.requests = 0
+        self.parent = parent
+        self._lock = threading.Lock()
+
+    def child(self, seconds=None, requests=None):
+        """创建受当前预算约束的子预算"""
+        return Budget(seconds, requests, parent=self)
+
+    def remaining(self):
+        """剩余秒数（取整条预算链的最小值），无时间限制时返回 None"""
+        remaining = None
+        if self.deadline is not None:
+            remaining = self.deadline - time.monotonic()
+        if self.parent:
+            parent_remaining = self.parent.remaining()
+            if parent_remaining is not None:
+                remaining = parent_remaining if remaining is None else min(remaining, parent_remaining)
+        return remaining
+
+    @property
+    def exhausted(self):
+        """时间或请求数是否已用尽"""
+        remaining = self.remaining()
+        if remaining is not None and remaining <= 0:
+            return True
+        if self.max_requests is not None and self.requests >= self.max_requests:
+            return True
+        return bool(self.parent and self.parent.exhausted)
+
+    def _count(self):
+        with self._lock:
+            self.requests += 1
+        if self.parent:
+            self.parent._count()
+
+    def spend(self, timeout):
+        """
+        登记一次请求，返回按剩余时间收缩后的超时（不会超过截止时间）
+        预算耗尽或剩余时间不足 MIN_REQUEST_TIMEOUT 时抛出 BudgetExhausted
+        """
+        remaining = self.remaining()
+        if self.exhausted or (remaining is not None and remaining < MIN_REQUEST_TIMEOUT):
+            raise BudgetExhausted()
+        self._count()
+        if remaining is not None:
+            timeout = min(timeout, remaining)
+        return timeout
+
+
 # ===================== 番茄小说官方 Web API =====================
 
 
-def fanqie_get_book_info(book_id):
+def fanqie_get_book_info(book_id, budget=None):
     """
     从番茄小说网页获取书籍信息
     返回: (book_name, author, chapter_count, latest_chapter_title)
     """
+    budget = budget or Budget()
     url = f"{FANQIE_WEB_BASE}/page/{book_id}"
+    timeout = budget.spend(15)
     try:
         rotate_ua()
-        resp = session.get(url, timeout=15)
+        resp = session.get(url, timeout=timeout)
         if resp.status_code != 200:
             return None, None, None, None
     except Exception as e:
@@ -127,16 +236,18 @@ def fanqie_get_book_info(book_id):
     return book_name, author, chapter_count, latest_chapter
 
 
-def fanqie_get_chapter_list(book_id):
+def fanqie_get_chapter_list(book_id, budget=None):
     """
     从番茄小说官方API获取章节列表
     API: /api/reader/directory/detail?bookId={book_id}
     返回: [(item_id, title), ...]
     """
+    budget = budget or Budget()
     # 预热：先访问页面获取Cookie
+    timeout = budget.spend(10)
     try:
         rotate_ua()
-        session.get(f"{FANQIE_WEB_BASE}/page/{book_id}", timeout=10)
+        session.get(f"{FANQIE_WEB_BASE}/page/{book_id}", timeout=timeout)
     except Exception:
         pass
     time.sleep(random.uniform(0.3, 0.8))
@@ -147,9 +258,10 @@ def fanqie_get_chapter_list(book_id):
         "Referer": f"{FANQIE_WEB_BASE}/page/{book_id}",
     }
 
+    timeout = budget.spend(15)
     try:
         rotate_ua()
-        resp = session.get(url, timeout=15, headers=json_headers)
+        resp = session.get(url, timeout=timeout, headers=json_headers)
         if resp.status_code != 200:
             print(f"    ⚠️ 章节列表API返回 HTTP {resp.status_code}")
             return []
@@ -188,6 +300,110 @@ def fanqie_get_chapter_list(book_id):
     return result
 
 
+def new_web_session():
+    """创建独立的网页会话（独立 Cookie 与 User-Agent）"""
+    sess = requests.Session()
+    sess.headers.update(session.headers)
+    sess.headers["User-Agent"] = random.choice(USER_AGENTS)
+    return sess
+
+
+def fanqie_get_chapter_content(item_id, sess, budget=None):
+    """
+    从番茄小说网页抓取单章内容（有字体混淆）
+    返回: (page_title, raw_content) 或 None
+    """
+    budget = budget or Budget()
+    timeout = budget.spend(15)
+    try:
+        resp = sess.get(f"{FANQIE_WEB_BASE}/reader/{item_id}", timeout=timeout)
+        if resp.status_code != 200:
+            return None
+        # 解析 __INITIAL_STATE__
+        pattern = r'window\.__INITIAL_STATE__\s*=\s*(\{.*?\})\s*;'
+        match = re.search(pattern, resp.text, re.DOTALL)
+        if not match:
+            return None
+        page_data = json.loads(match.group(1).strip())
+        reader = page_data.get("reader", {})
+        chapter_data = reader.get("chapterData", {})
+        raw = chapter_data.get("content", "")
+        page_title = chapter_data.get("title", "") or chapter_data.get("chapterTitle", "")
+        if raw and len(raw.strip()) > 20:
+            return page_title, raw
+    except Exception:
+        pass
+    return None
+
+
+def fanqie_scrape_chapters(book_id, items, pool_size=WEB_POOL_SIZE, budget=None):
+    """
+    使用会话池并发抓取章节网页
+    items: [(key, item_id, title), ...]
+    每个会话先访问书籍页面获取自己的 Cookie，之后按 WEB_PACE 控制自身请求间隔，
+    并每 WEB_BURST_SIZE 章额外暂停 WEB_BURST_PAUSE
+    返回: ({key: (page_title, raw) 或 None}, 是否因预算耗尽而提前停止)
+          未出现在结果中的 key 表示尚未尝试
+    """
+    budget = budget or Budget()
+    tasks = Queue()
+    for item in items:
+        tasks.put(item)
+    results = {}
+    exhausted = threading.Event()
+    progress_lock = threading.Lock()
+    done = 0
+    ok = 0
+
+    def report(title, chapter):
+        """共享计数，首章成功及每 50 章输出一次进度"""
+        nonlocal done, ok
+        with progress_lock:
+            done += 1
+            if chapter:
+                ok += 1
+            if (chapter and ok == 1) or done % 50 == 0:
+                mark = "✅" if chapter else "❌"
+                shown = (chapter[0] if chapter else "") or title
+                print(f"  📥 [网页 {done}/{len(items)}] {mark} {shown}")
+
+    def worker():
+        sess = new_web_session()
+        try:
+            timeout = budget.spend(10)
+            sess.get(f"{FANQIE_WEB_BASE}/page/{book_id}", timeout=timeout)
+        except BudgetExhausted:
+            exhausted.set()
+            return
+        except Exception:
+            pass
+
+        fetched = 0
+        while not exhausted.is_set():
+            try:
+                key, item_id, title = tasks.get_nowait()
+            except Empty:
+                return
+            time.sleep(random.uniform(*WEB_PACE))
+            if fetched and fetched % WEB_BURST_SIZE == 0:
+                time.sleep(random.uniform(*WEB_BURST_PAUSE))
+            try:
+                chapter = fanqie_get_chapter_content(item_id, sess, budget)
+            except BudgetExhausted:
+                exhausted.set()
+                return
+            fetched += 1
+            results[key] = chapter
+            report(title, chapter)
+
+    workers = [threading.Thread(target=worker) for _ in range(max(1, min(pool_size, len(items))))]
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    return results, exhausted.is_set()
+
+
 def _regex_field(text, field):
     """正则提取JSON字段的字符串值"""
     pattern = rf'"{re.escape(field)}"\s*:\s*"(.*?)"'
@@ -219,9 +435,25 @@ def _regex_int_field(text, field):
 class ThirdPartyAPI:
     """第三方代理API管理器，支持多节点自动切换"""
 
-    def __init__(self, nodes=None):
-        self.nodes = list(nodes or THIRD_PARTY_NODES)
+    def __init__(self, nodes=None, hedge=False, hedge_percentile=HEDGE_PERCENTILE,
+                 hedge_max_ratio=HEDGE_MAX_RATIO):
+        self._all_nodes = list(nodes or THIRD_PARTY_NODES)
+        self.nodes = list(self._all_nodes)
         self._working_node = None
+        # 节点延迟探测: 首次真正需要第三方API时才探测
+        self.last_probe = None
+        # 当前生效的预算，处理每本小说时替换为该书的预算
+        self.budget = Budget()
+        # 对冲请求相关
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.hedge_max_ratio = hedge_max_ratio
+        self.hedge_requests = 0
+        self.hedges_sent = 0
+        self._latencies = defaultdict(lambda: deque(maxlen=200))
+        self._executor = None
+        self._inflight = 0
+        self._inflight_lock = threading.Lock()
         self._session = requests.Session()
         self._session.headers.update({
             "User-Agent": random.choice(USER_AGENTS),
@@ -231,31 +463,120 @@ class ThirdPartyAPI:
             "Content-Type": "application/json",
         })
 
+    def _ordered_nodes(self):
+        """节点尝试顺序: 上次成功的节点优先"""
+        nodes_to_try = []
+        if self._working_node:
+            nodes_to_try.append(self._working_node)
+        nodes_to_try.extend(n for n in self.nodes if n != self._working_node)
+        return nodes_to_try
+
+    def _try_node(self, node, endpoint, params, timeout):
+        """
+        向单个节点发起一次请求
+        成功时记录延迟样本并返回数据，失败返回 None
+        不修改 _working_node: 对冲时可能在线程池中执行，由调用方为胜出的节点设置
+        """
+        timeout = self.budget.spend(timeout)
+        url = f"{node.rstrip('/')}{endpoint}"
+        start = time.monotonic()
+        try:
+            resp = self._session.get(url, params=params, timeout=timeout, verify=False)
+            if resp.status_code == 200:
+                data = resp.json()
+                if data.get("code") == 200:
+                    self._latencies[endpoint].append(time.monotonic() - start)
+                    return data
+        except Exception:
+            pass
+        return None
+
     def _request(self, endpoint, params, timeout=15):
         """
         带节点自动切换的请求
         优先使用上次成功的节点
         """
-        nodes_to_try = []
-        if self._working_node:
-            nodes_to_try.append(self._working_node)
-        nodes_to_try.extend(n for n in self.nodes if n != self._working_node)
+        for node in self._ordered_nodes():
+            data = self._try_node(node, endpoint, params, timeout)
+            if data:
+                self._working_node = node
+                return data
 
-        for node in nodes_to_try:
-            url = f"{node.rstrip('/')}{endpoint}"
-            try:
-                resp = self._session.get(url, params=params, timeout=timeout, verify=False)
-                if resp.status_code == 200:
-                    data = resp.json()
-                    if data.get("code") == 200:
-                        self._working_node = node
-                        return data
-                elif resp.status_code == 500:
-                    # 服务端错误，可能是临时的
-                    continue
-            except Exception:
+        return None
+
+    def _hedge_delay(self, endpoint):
+        """对冲延迟: 该端点成功延迟的分位数"""
+        samples = sorted(self._latencies[endpoint])
+        if len(samples) < HEDGE_MIN_SAMPLES:
+            return HEDGE_DEFAULT_DELAY
+        index = min(len(samples) - 1, int(len(samples) * self.hedge_percentile))
+        return samples[index]
+
+    def _hedge_allowed(self):
+        """
+        对冲配额: 已发对冲数不超过逐章请求数的 hedge_max_ratio
+        且线程池中至少留出一个空闲线程，保证下一个主请求无需排队
+        """
+        if self._inflight >= HEDGE_POOL_SIZE - 1:
+            return False
+        return self.hedges_sent + 1 <= self.hedge_requests * self.hedge_max_ratio
+
+    def _release_inflight(self, future):
+        with self._inflight_lock:
+            self._inflight -= 1
+
+    def _hedged_request(self, attempts):
+        """
+        按顺序尝试 attempts [(node, endpoint, params, timeout), ...]
+        当前请求超过延迟分位数仍未返回时（且配额允许），提前发出下一个请求
+        先返回有效数据的请求胜出，其余请求在后台自然结束
+        """
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=HEDGE_POOL_SIZE)
+
+        self.hedge_requests += 1
+        pending = {}
+        next_attempt = 0
+
+        def launch():
+            nonlocal next_attempt
+            if next_attempt >= len(attempts):
+                return False
+            node, endpoint, params, timeout = attempts[next_attempt]
+            next_attempt += 1
+            with self._inflight_lock:
+                self._inflight += 1
+            future = self._executor.submit(self._try_node, node, endpoint, params, timeout)
+            future.add_done_callback(self._release_inflight)
+            pending[future] = node
+            return True
+
+        launch()
+        while pending:
+            can_hedge = (
+                next_attempt < len(attempts) and self._hedge_allowed() and not self.budget.exhausted
+            )
+            delay = self._hedge_delay(attempts[next_attempt - 1][1]) if can_hedge else None
+            done, _ = wait(list(pending), timeout=delay, return_when=FIRST_COMPLETED)
+
+            if not done:
+                # 超过延迟分位数仍未返回，补发对冲请求
+                if launch():
+                    self.hedges_sent += 1
                 continue
 
+            for future in done:
+                node = pending.pop(future)
+                data = future.result()
+                if data and data.get("data"):
+                    # 只有胜出的请求才更新首选节点，落败请求在后台结束时不影响
+                    self._working_node = node
+                    return data
+
+            # 已完成的请求均失败，且没有在途请求时，顺延到下一个
+            if not pending:
+                launch()
+
         return None
 
     def probe_nodes(self):
@@ -263,11 +584,12 @@ class ThirdPartyAPI:
         print("  🔍 探测第三方API节点...")
         available = []
         for node in self.nodes:
+            timeout = self.budget.spend(8)
             try:
                 resp = self._session.get(
                     f"{node.rstrip('/')}/api/detail",
                     params={"book_id": "7404826300126333977"},
-                    timeout=8,
+                    timeout=timeout,
                     verify=False,
                 )
                 if resp.status_code == 200:
@@ -283,10 +605,19 @@ class ThirdPartyAPI:
                 print(f"    ❌ {node} ({type(e).__name__})")
 
         self.nodes = available
+        self.last_probe = time.monotonic()
         if available:
             self._working_node = available[0]
+        else:
+            print("  ⚠️ 所有第三方API节点不可用，将使用番茄小说网页直接抓取（可能有字体混淆）")
         return len(available) > 0
 
+    def reset_nodes(self):
+        """恢复完整节点列表，下次使用时重新探测"""
+        self.nodes = list(self._all_nodes)
+        self._working_node = None
+        self.last_probe = None
+
     def get_book_detail(self, book_id):
         """获取书籍详情"""
         data = self._request("/api/detail", {"book_id": book_id})
@@ -309,6 +640,13 @@ class ThirdPartyAPI:
 
     def get_chapter_content(self, item_id):
         """获取单章内容"""
+        if self.hedge:
+            nodes = self._ordered_nodes()
+            attempts = [(node, "/api/chapter", {"item_id": item_id}, 10) for node in nodes]
+            attempts += [(node, "/api/content", {"tab": "小说", "item_id": item_id}, 15) for node in nodes]
+            data = self._hedged_request(attempts)
+            return data["data"] if data else None
+
         # 优先 /api/chapter
         data = self._request("/api/chapter", {"item_id": item_id}, timeout=10)
         if data and data.get("data"):
@@ -336,9 +674,10 @@ class ThirdPartyAPI:
             for tab in ["批量", "下载"]:
                 url = f"{node.rstrip('/')}/api/content"
                 params = {"tab": tab, "book_id": book_id}
+                timeout = self.budget.spend(120)
                 try:
                     resp = self._session.get(
-                        url, params=params, timeout=120, verify=False, stream=True
+                        url, params=params, timeout=timeout, verify=False, stream=True
                     )
                     if resp.status_code != 200:
                         continue
@@ -375,7 +714,9 @@ class ThirdPartyAPI:
 
     @property
     def available(self):
-        """是否有可用节点"""
+        """是否有可用节点（首次访问时探测节点）"""
+        if self.last_probe is None:
+            self.probe_nodes()
         return bool(self.nodes)
 
 
@@ -433,13 +774,109 @@ def save_state(state):
         print(f"  ⚠️ 保存状态失败: {e}")
 
 
+# ===================== 状态恢复 =====================
+
+
+def scan_output_file(path):
+    """
+    单次流式扫描已有输出文件，解析出各章节块
+    文件格式: 书名/作者/分隔线头部，之后每章为 "\n{标题}\n\n{正文或占位}\n"
+    返回: [(title, status, start_offset), ...]，status 为 "ok" / "failed" / "empty"
+          未找到头部分隔线时返回 None
+    """
+    blocks = []
+    header_done = False
+    prev_blank = False
+    offset = 0
+    blank_offset = 0
+
+    with open(path, "rb") as f:
+        for raw in f:
+            line = raw.decode("utf-8", errors="replace").rstrip("\r\n")
+            line_offset = offset
+            offset += len(raw)
+
+            if not header_done:
+                if len(line) >= 10 and set(line) == {"="}:
+                    header_done = True
+                    prev_blank = False
+                continue
+
+            if not line.strip():
+                if not prev_blank:
+                    blank_offset = line_offset
+                prev_blank = True
+                continue
+
+            if line.startswith("　　"):
+                if blocks and blocks[-1][1] == "empty":
+                    blocks[-1][1] = "ok"
+            elif line == FAILED_PLACEHOLDER:
+                if blocks and blocks[-1][1] == "empty":
+                    blocks[-1][1] = "failed"
+            elif prev_blank:
+                # 空行之后、非正文缩进的行即为章节标题
+                blocks.append([line, "empty", blank_offset])
+            prev_blank = False
+
+    if not header_done:
+        return None
+    return [tuple(b) for b in blocks]
+
+
+def _titles_match(file_title, list_title):
+    """章节标题是否对应（接口标题与目录标题可能略有差异）"""
+    a = re.sub(r'\s+', '', file_title)
+    b = re.sub(r'\s+', '', list_title)
+    if a == b or a in b or b in a:
+        return True
+    num_a = re.search(r'第(\d+)章', a)
+    num_b = re.search(r'第(\d+)章', b)
+    return bool(num_a and num_b and num_a.group(1) == num_b.group(1))
+
+
+def recover_from_output(path, chapters):
+    """
+    根据已有输出文件重建章节进度
+    按顺序将文件中的章节块与章节列表对齐，遇到不对应或不完整的块即停止，
+    并截断其后的内容，保证之后的增量追加不会重复
+    返回: (已有章节数, 其中失败占位章节数)，无法恢复时返回 None
+    """
+    try:
+        blocks = scan_output_file(path)
+    except Exception as e:
+        print(f"  ⚠️ 扫描输出文件失败: {e}")
+        return None
+    if not blocks:
+        return None
+
+    matched = 0
+    failed = 0
+    for (title, status, _), (_, list_title) in zip(blocks, chapters):
+        if status == "empty" or not _titles_match(title, list_title):
+            break
+        if status == "failed":
+            failed += 1
+        matched += 1
+
+    if matched == 0:
+        return None
+    if matched < len(blocks):
+        os.truncate(path, blocks[matched][2])
+    return matched, failed
+
+
 # ===================== 主处理逻辑 =====================
 
 
-def process_novel(novel, state, third_party_api):
+def process_novel(novel, state, third_party_api, budget=None, web_pool_size=WEB_POOL_SIZE):
     """
     处理单本小说的完整流程
+    budget: 该书的时间/请求预算，耗尽时保存已连续下载的章节后返回
+    web_pool_size: 网页抓取兜底的并发会话数
     """
+    budget = budget or Budget()
+    third_party_api.budget = budget
     name = novel["name"]
     author = novel["author"]
     book_id = novel.get("book_id", "")
@@ -459,8 +896,13 @@ def process_novel(novel, state, third_party_api):
     real_name = name  # 优先使用用户配置的名称
     real_author = author
 
-    # 先尝试第三方API
-    if third_party_api.available:
+    state_key = str(book_id)
+    prev_state = state.get(state_key, {})
+
+    # 已有状态时沿用上次确定的作者，无需为此初始化第三方API
+    if prev_state.get("author"):
+        real_author = prev_state["author"]
+    elif third_party_api.available:
         detail = third_party_api.get_book_detail(book_id)
         if detail and isinstance(detail, dict):
             api_author = detail.get("author", "")
@@ -471,7 +913,7 @@ def process_novel(novel, state, third_party_api):
                 print(f"  📝 API书名: {api_name}")
 
     # 从番茄网页获取补充信息
-    web_name, web_author, web_chapter_count, web_latest = fanqie_get_book_info(book_id)
+    web_name, web_author, web_chapter_count, web_latest = fanqie_get_book_info(book_id, budget)
     if web_author and not real_author:
         real_author = web_author
 
@@ -481,7 +923,7 @@ def process_novel(novel, state, third_party_api):
 
     # ==================== 2. 获取章节列表 ====================
     print("  📋 获取章节列表...")
-    chapters = fanqie_get_chapter_list(book_id)
+    chapters = fanqie_get_chapter_list(book_id, budget)
     total_chapters = len(chapters)
 
     if total_chapters == 0:
@@ -494,19 +936,31 @@ def process_novel(novel, state, third_party_api):
     print(f"  📖 最新章节: {latest_chapter_title}")
 
     # ==================== 3. 检查增量更新 ====================
-    state_key = str(book_id)
-    prev_state = state.get(state_key, {})
+    target_filename = f"{sanitize_filename(real_name)}-{sanitize_filename(real_author)}.txt"
+    target_path = OUTPUT_DIR / target_filename
     prev_count = prev_state.get("chapter_count", 0)
     prev_content_file = prev_state.get("content_file", "")
 
+    # 状态丢失或内容文件不存在，但输出文件仍在: 从输出文件重建状态
+    if not (prev_content_file and Path(prev_content_file).exists()) and target_path.exists():
+        recovered = recover_from_output(target_path, chapters)
+        if recovered:
+            prev_count, recovered_failed = recovered
+            prev_content_file = str(target_path)
+            print(f"  ♻️ 从输出文件恢复 {prev_count} 章 (其中 {recovered_failed} 章为失败占位)")
+            state[state_key] = {
+                "name": real_name,
+                "author": real_author,
+                "chapter_count": prev_count,
+                "latest_chapter": chapters[prev_count - 1][1],
+                "content_file": prev_content_file,
+                "last_update": time.strftime("%Y-%m-%d %H:%M:%S"),
+            }
+
     if prev_count >= total_chapters:
         print(f"  ✅ 无新章节 (已有 {prev_count} 章)")
-        target_filename = f"{sanitize_filename(real_name)}-{sanitize_filename(real_author)}.txt"
-        target_path = OUTPUT_DIR / target_filename
         if prev_content_file and Path(prev_content_file).exists():
-            os.makedirs(OUTPUT_DIR, exist_ok=True)
-            import shutil
-            shutil.copy2(prev_content_file, target_path)
+            place_output(Path(prev_content_file), target_path)
         return {
             "name": real_name, "author": real_author, "success": True,
             "filename": target_filename, "new_chapters": 0,
@@ -517,8 +971,6 @@ def process_novel(novel, state, third_party_api):
     print(f"  🆕 新增 {new_count} 章 (从第 {prev_count+1} 章开始)")
 
     # ==================== 4. 下载内容 ====================
-    target_filename = f"{sanitize_filename(real_name)}-{sanitize_filename(real_author)}.txt"
-    target_path = OUTPUT_DIR / target_filename
     os.makedirs(OUTPUT_DIR, exist_ok=True)
 
     # 加载已有内容（增量更新）
@@ -554,12 +1006,17 @@ def process_novel(novel, state, third_party_api):
     chapters_to_download = chapters[prev_count:]
     downloaded_content = [None] * len(chapters_to_download)
     fail_count = 0
+    budget_exhausted = False
+    attempted = set()  # 已尝试但未成功的章节下标，预算耗尽时写为失败占位
 
     # ---- 策略1: 尝试第三方API整本下载（批量模式） ----
     full_book_data = None
     if third_party_api.available and prev_count == 0:
         print("  🚀 尝试极速下载模式（整本批量）...")
-        full_book_data = third_party_api.get_full_book(book_id)
+        try:
+            full_book_data = third_party_api.get_full_book(book_id)
+        except BudgetExhausted:
+            budget_exhausted = True
         if full_book_data:
             matched = 0
             for i, (item_id, title) in enumerate(chapters_to_download):
@@ -573,7 +1030,7 @@ def process_novel(novel, state, third_party_api):
                 # 大多数章节成功，标记剩余为失败
                 for i in range(len(chapters_to_download)):
                     if downloaded_content[i] is None:
-                        downloaded_content[i] = f"\n{chapters_to_download[i][1]}\n\n[内容获取失败]\n"
+                        downloaded_content[i] = f"\n{chapters_to_download[i][1]}\n\n{FAILED_PLACEHOLDER}\n"
                         fail_count += 1
                 # 跳过后续下载
                 full_book_data = "DONE"
@@ -583,7 +1040,7 @@ def process_novel(novel, state, third_party_api):
                 print("  ⚠️ 极速模式匹配率不足，切换到逐章下载")
 
     # ---- 策略2: 第三方API逐章下载 ----
-    if full_book_data != "DONE" and third_party_api.available:
+    if full_book_data != "DONE" and third_party_api.available and not budget_exhausted:
         print("  📥 使用第三方API逐章下载...")
         chapters_remaining = [(i, ch) for i, ch in enumerate(chapters_to_download) if downloaded_content[i] is None]
 
@@ -602,10 +1059,14 @@ def process_novel(novel, state, third_party_api):
                         if (idx + 1) % 50 == 0 or idx == 0:
                             print(f"  📥 [{chapter_num}/{total_chapters}] ✅ {display_title}")
                         continue
+            except BudgetExhausted:
+                budget_exhausted = True
+                break
             except Exception:
                 pass
 
             # 当前章节未获取到
+            attempted.add(i)
             if (idx + 1) % 50 == 0:
                 print(f"  📥 [{chapter_num}/{total_chapters}] ❌ {title}")
 
@@ -615,50 +1076,49 @@ def process_novel(novel, state, third_party_api):
 
     # ---- 策略3: 直接从番茄小说网页抓取章节内容（兜底，有字体混淆） ----
     chapters_still_missing = [(i, ch) for i, ch in enumerate(chapters_to_download) if downloaded_content[i] is None]
-    if chapters_still_missing:
-        print(f"  🌐 还有 {len(chapters_still_missing)} 章未获取，尝试从番茄网页直接抓取...")
-        for idx, (i, (item_id, title)) in enumerate(chapters_still_missing):
-            chapter_num = prev_count + i + 1
-            try:
-                rotate_ua()
-                resp = session.get(f"{FANQIE_WEB_BASE}/reader/{item_id}", timeout=15)
-                if resp.status_code == 200:
-                    # 解析 __INITIAL_STATE__
-                    pattern = r'window\.__INITIAL_STATE__\s*=\s*(\{.*?\})\s*;'
-                    match = re.search(pattern, resp.text, re.DOTALL)
-                    if match:
-                        page_data = json.loads(match.group(1).strip())
-                        reader = page_data.get("reader", {})
-                        chapter_data = reader.get("chapterData", {})
-                        raw = chapter_data.get("content", "")
-                        page_title = chapter_data.get("title", "") or chapter_data.get("chapterTitle", "")
-                        display_title = page_title if page_title else title
-
-                        if raw and len(raw.strip()) > 20:
-                            content = clean_content(raw)
-                            downloaded_content[i] = f"\n{display_title}\n\n{content}\n"
-                            if (idx + 1) % 50 == 0 or idx == 0:
-                                print(f"  📥 [{chapter_num}/{total_chapters}] ✅ {display_title} (网页)")
-                            # 延迟，避免被封
-                            time.sleep(random.uniform(0.3, 0.8))
-                            continue
-            except Exception:
-                pass
-
-            # 最终标记为失败
-            downloaded_content[i] = f"\n{title}\n\n[内容获取失败]\n"
-            fail_count += 1
-            if (idx + 1) % 50 == 0:
-                print(f"  📥 [{chapter_num}/{total_chapters}] ❌ {title}")
-
-            if (idx + 1) % 10 == 0:
-                time.sleep(random.uniform(0.5, 1.0))
+    if chapters_still_missing and not budget_exhausted:
+        pool_size = max(1, min(web_pool_size, len(chapters_still_missing)))
+        print(f"  🌐 还有 {len(chapters_still_missing)} 章未获取，尝试从番茄网页直接抓取 ({pool_size} 个会话)...")
+        scraped, budget_exhausted = fanqie_scrape_chapters(
+            book_id, [(i, item_id, title) for i, (item_id, title) in chapters_still_missing],
+            pool_size=pool_size, budget=budget,
+        )
+        # 按原顺序合并结果，未尝试的章节留给预算处理
+        web_ok = 0
+        for i, (item_id, title) in chapters_still_missing:
+            if i not in scraped:
+                continue
+            chapter = scraped[i]
+            if chapter:
+                page_title, raw = chapter
+                downloaded_content[i] = f"\n{page_title or title}\n\n{clean_content(raw)}\n"
+                web_ok += 1
+            else:
+                # 最终标记为失败
+                downloaded_content[i] = f"\n{title}\n\n{FAILED_PLACEHOLDER}\n"
+                fail_count += 1
+        print(f"  📥 网页抓取: 成功 {web_ok}/{len(scraped)} 章")
 
     # ==================== 5. 合并并保存 ====================
+    if budget_exhausted:
+        # 预算耗尽: 保存到第一个尚未尝试的章节为止（已尝试但失败的章节写为占位），其余留给下次运行
+        saved = next(
+            (i for i, c in enumerate(downloaded_content) if c is None and i not in attempted),
+            len(downloaded_content),
+        )
+        print(f"  ⏱️ 预算耗尽，保存已下载的 {saved}/{len(chapters_to_download)} 章")
+        chapters_to_download = chapters_to_download[:saved]
+        downloaded_content = downloaded_content[:saved]
+        total_chapters = prev_count + saved
+        new_count = saved
+        if total_chapters == 0:
+            return {"name": real_name, "author": real_author, "success": False, "reason": "budget_exhausted"}
+        latest_chapter_title = chapters[total_chapters - 1][1]
+
     # 过滤掉 None（不应存在，但以防万一）
     for i in range(len(downloaded_content)):
         if downloaded_content[i] is None:
-            downloaded_content[i] = f"\n{chapters_to_download[i][1]}\n\n[内容获取失败]\n"
+            downloaded_content[i] = f"\n{chapters_to_download[i][1]}\n\n{FAILED_PLACEHOLDER}\n"
             fail_count += 1
 
     new_content = "".join(downloaded_content)
@@ -667,13 +1127,25 @@ def process_novel(novel, state, third_party_api):
     else:
         full_content = f"《{real_name}》\n作者：{real_author}\n\n{'='*40}\n" + new_content
 
-    with open(target_path, "w", encoding="utf-8") as f:
+    # 先写临时文件再替换，避免改动与之硬链接的旧内容文件
+    tmp_path = target_path.with_name(target_path.name + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
         f.write(full_content)
+    os.replace(tmp_path, target_path)
 
     file_size = target_path.stat().st_size
     print(f"  💾 已保存: {target_filename} ({file_size/1024/1024:.1f}MB)")
     print(f"  📊 下载 {len(chapters_to_download)} 章, 失败 {fail_count} 章")
 
+    # 增量文件: 仅包含本次新增章节, 追加到校验和为 base_sha256 的全文后即得到新全文
+    delta_info = {}
+    if existing_content and new_content:
+        delta_info = write_delta(
+            target_filename, new_content,
+            base_content=existing_content, full_content=full_content,
+            from_chapter=prev_count + 1, to_chapter=total_chapters,
+        )
+
     # 更新状态
     state[state_key] = {
         "name": real_name,
@@ -689,6 +1161,67 @@ def process_novel(novel, state, third_party_api):
         "filename": target_filename, "file_size": file_size,
         "new_chapters": new_count, "total_chapters": total_chapters,
         "fail_count": fail_count, "latest_chapter": latest_chapter_title,
+        "budget_exhausted": budget_exhausted,
+        **delta_info,
+    }
+
+
+def place_output(src, dst):
+    """
+    将未变化的内容文件放到输出位置
+    已是同一文件则保持不动，否则优先硬链接，失败时再复制
+    """
+    if dst.exists() and os.path.samefile(src, dst):
+        return
+    os.makedirs(dst.parent, exist_ok=True)
+    tmp = dst.with_name(dst.name + ".tmp")
+    try:
+        if tmp.exists():
+            tmp.unlink()
+        os.link(src, tmp)
+        os.replace(tmp, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def write_delta(target_filename, new_content, base_content, full_content, from_chapter, to_chapter):
+    """
+    写出本次运行的增量文件及其清单
+    增量文件: 书名-作者.delta-{起始章}-{结束章}.txt
+    清单文件: 同名 .json，记录其适用的全文校验和
+    返回: 写入 process_novel 结果的增量信息
+    """
+    stem = Path(target_filename).stem
+    delta_filename = f"{stem}.delta-{from_chapter}-{to_chapter}.txt"
+    manifest_filename = f"{stem}.delta-{from_chapter}-{to_chapter}.json"
+    base_sha256 = sha256_text(base_content)
+    full_sha256 = sha256_text(full_content)
+    manifest = {
+        "file": target_filename,
+        "delta": delta_filename,
+        "from_chapter": from_chapter,
+        "to_chapter": to_chapter,
+        "base_sha256": base_sha256,
+        "full_sha256": full_sha256,
+        "delta_sha256": sha256_text(new_content),
+    }
+
+    try:
+        os.makedirs(DELTA_DIR, exist_ok=True)
+        with open(DELTA_DIR / delta_filename, "w", encoding="utf-8") as f:
+            f.write(new_content)
+        with open(DELTA_DIR / manifest_filename, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+    except Exception as e:
+        print(f"  ⚠️ 写出增量文件失败: {e}")
+        return {}
+
+    print(f"  🧩 增量文件: {delta_filename} (第 {from_chapter}-{to_chapter} 章)")
+    return {
+        "delta_filename": delta_filename,
+        "delta_manifest": manifest_filename,
+        "base_sha256": base_sha256,
+        "full_sha256": full_sha256,
     }
 
 
@@ -701,8 +1234,147 @@ def load_config():
         return json.load(f)
 
 
+def create_third_party_api(config):
+    """按配置创建第三方API管理器"""
+    hedge = config.get("hedge", {})
+    if isinstance(hedge, bool):
+        hedge = {"enabled": hedge}
+    return ThirdPartyAPI(
+        hedge=hedge.get("enabled", False),
+        hedge_percentile=hedge.get("percentile", HEDGE_PERCENTILE),
+        hedge_max_ratio=hedge.get("max_ratio", HEDGE_MAX_RATIO),
+    )
+
+
+# ===================== 守护模式 =====================
+
+
+def start_status_server(status, lock, host, port):
+    """
+    在后台线程启动本地状态接口
+    GET 任意路径返回 JSON 格式的运行状态
+    """
+
+    class StatusHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            with lock:
+                body = json.dumps(status, ensure_ascii=False, indent=2).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), StatusHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"🩺 状态接口: http://{host}:{port}/")
+    return server
+
+
+def prune_deltas(max_age):
+    """删除修改时间早于 max_age 秒前的增量文件"""
+    if not DELTA_DIR.exists():
+        return
+    cutoff = time.time() - max_age
+    for path in DELTA_DIR.iterdir():
+        try:
+            if path.is_file() and path.stat().st_mtime < cutoff:
+                path.unlink()
+        except OSError:
+            pass
+
+
+def run_daemon(config, novels, port=DAEMON_STATUS_PORT):
+    """
+    守护模式主循环
+    复用同一个 ThirdPartyAPI（会话与节点状态保持热态），
+    每本书按各自的 interval 轮询，有新章节即写出 output/
+    """
+    daemon_config = config.get("daemon", {})
+    default_interval = daemon_config.get("interval", DAEMON_POLL_INTERVAL)
+    delta_retention = daemon_config.get("delta_retention", DAEMON_DELTA_RETENTION)
+    budget_config = config.get("budget", {})
+
+    third_party_api = create_third_party_api(config)
+
+    state = load_state()
+    lock = threading.Lock()
+    status = {
+        "started": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "nodes": list(third_party_api.nodes),
+        "books": {},
+    }
+    server = start_status_server(
+        status, lock, daemon_config.get("host", DAEMON_STATUS_HOST), port
+    )
+
+    next_due = [0.0] * len(novels)
+    try:
+        while True:
+            for i, novel in enumerate(novels):
+                if time.monotonic() < next_due[i]:
+                    continue
+
+                # 无可用节点时定期重置，下次需要时重新探测
+                if (third_party_api.last_probe is not None and not third_party_api.nodes
+                        and time.monotonic() - third_party_api.last_probe >= DAEMON_REPROBE_INTERVAL):
+                    third_party_api.reset_nodes()
+
+                book_budget = Budget(
+                    seconds=budget_config.get("book_seconds"),
+                    requests=budget_config.get("book_requests"),
+                )
+                try:
+                    result = process_novel(
+                        novel, state, third_party_api, book_budget,
+                        config.get("web_pool_size", WEB_POOL_SIZE),
+                    )
+                except BudgetExhausted:
+                    print(f"  ⏱️ 《{novel['name']}》预算耗尽，本书未保存新进度")
+                    result = {
+                        "name": novel["name"], "author": novel["author"],
+                        "success": False, "reason": "budget_exhausted",
+                    }
+                except Exception as e:
+                    print(f"  ❌ 《{novel['name']}》处理异常: {e}")
+                    result = {
+                        "name": novel["name"], "author": novel["author"],
+                        "success": False, "reason": str(e),
+                    }
+                save_state(state)
+
+                interval = novel.get("interval", default_interval)
+                next_due[i] = time.monotonic() + interval
+                with lock:
+                    status["nodes"] = list(third_party_api.nodes)
+                    status["books"][str(novel.get("book_id") or novel["name"])] = {
+                        **result,
+                        "last_check": time.strftime("%Y-%m-%d %H:%M:%S"),
+                        "next_check": time.strftime(
+                            "%Y-%m-%d %H:%M:%S", time.localtime(time.time() + interval)
+                        ),
+                    }
+
+            # 每次轮询都会产生增量文件，按保留时长清理
+            prune_deltas(delta_retention)
+            time.sleep(max(1.0, min(next_due) - time.monotonic()))
+    except KeyboardInterrupt:
+        print("\n👋 守护模式退出")
+    finally:
+        server.shutdown()
+        save_state(state)
+
+
 def main():
     """主函数"""
+    parser = argparse.ArgumentParser(description="HX-NovelSync - 小说自动同步")
+    parser.add_argument("--daemon", action="store_true", help="常驻运行，按间隔轮询各书")
+    parser.add_argument("--port", type=int, default=DAEMON_STATUS_PORT, help="守护模式状态接口端口")
+    args = parser.parse_args()
+
     print("=" * 60)
     print("📚 HX-NovelSync - 小说自动同步")
     print("   数据源: 番茄小说 (fanqienovel.com)")
@@ -717,19 +1389,51 @@ def main():
 
     print(f"📋 共 {len(novels)} 本小说待处理")
 
-    # 初始化第三方API
-    third_party_api = ThirdPartyAPI()
-    third_party_api.probe_nodes()
-    if not third_party_api.available:
-        print("  ⚠️ 所有第三方API节点不可用，将使用番茄小说网页直接抓取（可能有字体混淆）")
+    if args.daemon:
+        run_daemon(config, novels, args.port)
+        return
+
+    # 初始化第三方API（节点在首次需要下载内容时才探测）
+    third_party_api = create_third_party_api(config)
+
+    # 增量文件只属于本次运行，清理上次残留
+    if DELTA_DIR.exists():
+        shutil.rmtree(DELTA_DIR, ignore_errors=True)
+
+    # 运行预算: 整次运行 + 单本小说
+    budget_config = config.get("budget", {})
+    run_budget = Budget(
+        seconds=budget_config.get("run_seconds", RUN_TIME_BUDGET),
+        requests=budget_config.get("run_requests"),
+    )
 
     state = load_state()
     results = []
 
     for novel in novels:
+        if run_budget.exhausted:
+            print(f"  ⏱️ 运行预算耗尽，跳过《{novel['name']}》")
+            results.append({
+                "name": novel["name"], "author": novel["author"],
+                "success": False, "reason": "budget_exhausted",
+            })
+            continue
+        book_budget = run_budget.child(
+            seconds=budget_config.get("book_seconds"),
+            requests=budget_config.get("book_requests"),
+        )
         try:
-            result = process_novel(novel, state, third_party_api)
+            result = process_novel(
+                novel, state, third_party_api, book_budget,
+                config.get("web_pool_size", WEB_POOL_SIZE),
+            )
             results.append(result)
+        except BudgetExhausted:
+            print(f"  ⏱️ 《{novel['name']}》预算耗尽，本书未保存新进度")
+            results.append({
+                "name": novel["name"], "author": novel["author"],
+                "success": False, "reason": "budget_exhausted",
+            })
         except Exception as e:
             print(f"  ❌ 《{novel['name']}》处理异常: {e}")
             import traceback
@@ -741,6 +1445,9 @@ def main():
 
     save_state(state)
 
+    if third_party_api.hedge:
+        print(f"\n🪁 对冲请求: {third_party_api.hedges_sent}/{third_party_api.hedge_requests}")
+
     # 统计结果
     success_list = [r for r in results if r.get("success")]
     fail_list = [r for r in results if not r.get("success")]
@@ -771,6 +1478,11 @@ def main():
             if success_list:
                 filenames = ",".join(r["filename"] for r in success_list)
                 f.write(f"filenames={filenames}\n")
+            delta_list = [r for r in success_list if r.get("delta_filename")]
+            delta_filenames = ",".join(
+                f"{r['delta_filename']},{r['delta_manifest']}" for r in delta_list
+            )
+            f.write(f"delta_filenames={delta_filenames}\n")
 
     if not success_list:
         print("❌ 没有成功下载任何小说")